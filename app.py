@@ -1,57 +1,453 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import pydeck as pdk
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson  # parses API responses several times faster than the stdlib json module
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    import python_calamine  # noqa: F401  (Rust xlsx reader, much faster than openpyxl)
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = None  # let pandas fall back to openpyxl
+
+try:
+    import xlsxwriter  # faster, lighter xlsx writer than openpyxl
+    EXCEL_WRITE_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_WRITE_ENGINE = 'openpyxl'
+
+try:
+    import reverse_geocoder  # offline k-d tree lookup of the nearest known place
+except ImportError:
+    reverse_geocoder = None
+
+try:
+    import pyarrow  # noqa: F401  (multi-threaded CSV parser)
+    CSV_READ_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_READ_ENGINE = 'c'
 
 # ==============================
 # Utility functions
 # ==============================
 
-def load_file(uploaded_file):
-    filename = uploaded_file.name
+NOMINATIM_REVERSE_URL = "https://nominatim.openstreetmap.org/reverse"
+NOMINATIM_RATE_LIMIT = 1.0  # requests per second allowed by the Nominatim usage policy
+REQUEST_RETRIES = 3  # retries after a throttled (429), failed (5xx) or dropped request before giving up on a point
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+GEOCODE_MAX_WORKERS = 4  # concurrent lookups in flight; also sizes the HTTP connection pool
+PROGRESS_INTERVAL = 0.25  # minimum seconds between progress bar updates
+COORD_PRECISION = 5  # decimal places kept for lookups (~1 m), so GPS jitter shares one cache entry
+GEOCODING_PROVIDERS = {
+    'OpenStreetMap Nominatim (online)': 'osm',
+    'Offline (city/state only, no API calls)': 'offline'
+}
+GEOCODE_COLUMNS = ['State', 'City', 'Full Address']  # output columns, as returned by the geocoder
+# Coordinate column patterns, most specific first: an exact name beats a name that starts a word
+# (e.g. "gps_lat"), which beats a bare substring (e.g. "Plate No" must not win over "Latitude")
+LAT_COLUMN_PATTERNS = (
+    re.compile(r'^lat(itude)?$', re.I),
+    re.compile(r'(?<![a-z])lat', re.I),
+    re.compile(r'lat', re.I)
+)
+LON_COLUMN_PATTERNS = (
+    re.compile(r'^(lon|lng|long|longitude)$', re.I),
+    re.compile(r'(?<![a-z])(lon|lng)', re.I),
+    re.compile(r'lon|lng', re.I)
+)
+CITY_KEYS = ('city', 'town', 'village')  # Nominatim address fields tried in order for City
+CSV_WRITE_CHUNKSIZE = 50_000  # rows formatted per chunk when writing CSV exports
+EXCEL_WRITE_CHUNKSIZE = 10_000  # rows converted to Python objects at a time when writing xlsx exports
+EXCEL_MAX_ROWS, EXCEL_MAX_COLS = 1_048_576, 16_384  # worksheet size limits of the xlsx format
+MAP_AGGREGATE_THRESHOLD = 20_000  # above this many points the map switches to hexagon aggregation
+MAP_HEXAGON_RADIUS = 1000  # metres
+GEOCACHE_PATH = '.geocache.sqlite'
+GEOCACHE_TTL = 30 * 86400  # seconds a cached address stays valid
+# Bounds on the parsed uploads and export payloads kept in server memory (shared by all sessions)
+DATA_CACHE_MAX_ENTRIES = 4
+DATA_CACHE_TTL = 3600  # seconds
+
+class TokenBucket:
+    """Thread-safe token bucket that paces outbound API calls"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class GeocodeCache:
+    """Persistent SQLite cache of geocoding results, shared across sessions and server restarts"""
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS geocache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            self.conn.execute("DELETE FROM geocache WHERE expires <= ?", (time.time(),))
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires FROM geocache WHERE key = ?", (key,)).fetchone()
+        if row and row[1] > time.time():
+            return json_loads(row[0])
+        return None
+
+    def set(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocache VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + self.ttl)
+            )
+
+# Streamlit re-executes this script on every interaction; st.cache_resource keeps one rate limiter,
+# cache connection and HTTP session per server process, so pacing and pooled connections are
+# shared across reruns and browser sessions instead of being rebuilt each time.
+@st.cache_resource
+def get_rate_limiter():
+    return TokenBucket(NOMINATIM_RATE_LIMIT)
+
+@st.cache_resource
+def get_geocode_cache():
+    return GeocodeCache(GEOCACHE_PATH, GEOCACHE_TTL)
+
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()  # keep-alive: reuse one TCP/TLS connection across lookups
+    session.headers.update({'User-Agent': 'streamlit-geocoder-app'})
+    # A single host, so one pool holding a connection per worker thread: concurrent lookups never
+    # open throwaway sockets. No transport-level retries: urllib3 would resend without passing
+    # through the rate limiter, so _query_nominatim retries each attempt itself.
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=GEOCODE_MAX_WORKERS))
+    return session
+
+osm_rate_limiter = get_rate_limiter()
+geocode_cache = get_geocode_cache()
+http_session = get_http_session()
+
+def dedupe_column_names(columns):
+    """Rename repeated column names the way pandas' C parser does: name, name.1, name.2, ..."""
+    taken = set(columns)
+    counts = {}
+    names = []
+    for name in columns:
+        if name in counts:
+            # Skip suffixes that already exist as column names (e.g. a real "name.1" header)
+            suffix = counts[name]
+            while f"{name}.{suffix}" in taken:
+                suffix += 1
+            counts[name] = suffix + 1
+            name = f"{name}.{suffix}"
+            taken.add(name)
+        counts.setdefault(name, 1)
+        names.append(name)
+    return names
+
+# Cached on the file contents: every widget interaction reruns the script with the same upload
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_MAX_ENTRIES, ttl=DATA_CACHE_TTL)
+def load_file(file_bytes, filename):
     if filename.endswith('.xlsx'):
-        xls = pd.ExcelFile(uploaded_file)
+        xls = pd.ExcelFile(BytesIO(file_bytes), engine=EXCEL_READ_ENGINE)
         df = pd.read_excel(xls, sheet_name=xls.sheet_names[0])
     elif filename.endswith('.csv'):
-        df = pd.read_csv(uploaded_file)
+        df = pd.read_csv(BytesIO(file_bytes), engine=CSV_READ_ENGINE)
+        if df.columns.has_duplicates:
+            # The pyarrow engine keeps repeated headers as-is, which breaks column lookups later on
+            df.columns = dedupe_column_names(df.columns)
     else:
         raise ValueError("Unsupported file type")
     return df
 
+def _best_matching_column(columns, patterns):
+    """First column matching the most specific pattern that matches any column"""
+    for pattern in patterns:
+        match = next((c for c in columns if pattern.search(str(c))), None)
+        if match is not None:
+            return match
+    return None
+
 def find_coordinate_columns(df):
-    lat_col = next((c for c in df.columns if 'lat' in c.lower()), None)
-    lon_col = next((c for c in df.columns if 'lon' in c.lower() or 'lng' in c.lower()), None)
-    return lat_col, lon_col
+    return _best_matching_column(df.columns, LAT_COLUMN_PATTERNS), _best_matching_column(df.columns, LON_COLUMN_PATTERNS)
+
+def parse_coordinates(df, lat_col, lon_col):
+    """Numeric lat/lon columns (NaN where unparseable) and a mask of rows within valid ranges"""
+    lat = pd.to_numeric(df[lat_col], errors='coerce')
+    lon = pd.to_numeric(df[lon_col], errors='coerce')
+    return lat, lon, lat.between(-90, 90) & lon.between(-180, 180)
 
-def validate_coordinate_values(lat, lon):
+def retry_after_seconds(resp, attempt):
+    """Delay before retrying a request: the response's Retry-After if given, else exponential"""
+    headers = resp.headers if resp is not None else {}
     try:
-        lat = float(lat)
-        lon = float(lon)
-        if -90 <= lat <= 90 and -180 <= lon <= 180:
-            return True
-        return False
-    except Exception:
-        return False
+        delay = float(headers['Retry-After'])
+    except (KeyError, ValueError):
+        delay = None
+    if delay is None or not np.isfinite(delay):
+        delay = 2 ** attempt
+    return min(max(delay, 0), 60)
+
+def _query_nominatim(lat, lon):
+    """Request one point from Nominatim, retrying throttled, failed and dropped requests"""
+    params = {'lat': lat, 'lon': lon, 'format': 'json'}
+    for attempt in range(REQUEST_RETRIES + 1):
+        # Every attempt, retries included, waits for the rate limiter
+        osm_rate_limiter.acquire()
+        try:
+            resp = http_session.get(NOMINATIM_REVERSE_URL, params=params, timeout=10)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == REQUEST_RETRIES:
+                raise
+            resp = None
+        else:
+            if resp.status_code not in RETRY_STATUS_CODES or attempt == REQUEST_RETRIES:
+                break
+        time.sleep(retry_after_seconds(resp, attempt))
+    resp.raise_for_status()
+    data = json_loads(resp.content)
+    addr = data.get('address', {})
+    return {
+        'State': addr.get('state', 'Unknown'),
+        'City': next((addr[k] for k in CITY_KEYS if addr.get(k)), ''),
+        'Full Address': data.get('display_name', '')
+    }
 
-def reverse_geocode_osm(lat, lon):
+def osm_cache_key(lat, lon):
+    return f"osm:v2:{lat}:{lon}"
+
+# st.cache_data keeps results across Streamlit reruns (which re-execute this script) and the SQLite
+# cache keeps them across restarts; repeats within a run are already collapsed by reverse_geocode_batch.
+@st.cache_data(show_spinner=False, max_entries=200_000)
+def _fetch_osm_address(lat, lon):
+    """Cached Nominatim lookup; errors are raised so that failures are never cached"""
+    cache_key = osm_cache_key(lat, lon)
+    cached = geocode_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    result = _query_nominatim(lat, lon)
+    geocode_cache.set(cache_key, result)
+    return result
+
+def _refresh_osm_address(lat, lon):
+    """Fetch a point from Nominatim and replace its entries in both caches"""
+    result = _query_nominatim(lat, lon)
+    geocode_cache.set(osm_cache_key(lat, lon), result)
+    _fetch_osm_address.clear(lat, lon)  # the next call re-reads the fresh SQLite entry
+    return result
+
+def reverse_geocode_osm(lat, lon, refreshed=None):
     """Reverse geocode using OpenStreetMap Nominatim"""
-    url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lon}&format=json"
-    headers = {'User-Agent': 'streamlit-geocoder-app'}
+    key = (round(float(lat), COORD_PRECISION), round(float(lon), COORD_PRECISION))
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            addr = data.get('address', {})
-            return {
-                'state': addr.get('state', 'Unknown'),
-                'city': addr.get('city', addr.get('town', addr.get('village', ''))),
-                'full_address': data.get('display_name', '')
-            }
-        return {'state': 'Unknown', 'city': '', 'full_address': ''}
+        # refreshed (cache turned off): keys not yet in the set are re-fetched once, then served from cache
+        if refreshed is None or key in refreshed:
+            return _fetch_osm_address(*key)
+        result = _refresh_osm_address(*key)
+        refreshed.add(key)
+        return result
     except Exception:
-        return {'state': 'Unknown', 'city': '', 'full_address': ''}
+        return {'State': 'Unknown', 'City': '', 'Full Address': ''}
+
+@st.cache_resource(show_spinner="Loading offline place database...")
+def get_offline_geocoder():
+    return reverse_geocoder.RGeocoder(mode=2, verbose=False)
+
+def reverse_geocode_offline(keys):
+    """Resolve many points to their nearest known place in one local k-d tree query (no street detail)"""
+    places = get_offline_geocoder().query(keys)
+    return [
+        {
+            'State': place['admin1'] or 'Unknown',
+            'City': place['name'],
+            'Full Address': ', '.join(part for part in (place['name'], place['admin2'], place['admin1'], place['cc']) if part)
+        }
+        for place in places
+    ]
+
+def geohash_cell_center(lat, lon, precision):
+    """Centre of the geohash cell of the given precision (characters) containing each point; works on arrays"""
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lat_size = 180 / 2 ** lat_bits
+    lon_size = 360 / 2 ** lon_bits
+    lat_idx = np.minimum(np.floor((lat + 90) / lat_size), 2 ** lat_bits - 1)
+    lon_idx = np.minimum(np.floor((lon + 180) / lon_size), 2 ** lon_bits - 1)
+    return -90 + (lat_idx + 0.5) * lat_size, -180 + (lon_idx + 0.5) * lon_size
+
+def reverse_geocode_batch(coords, progress=None, cell_precision=None, provider='osm', refreshed=None):
+    """Reverse geocode (lat, lon) pairs in order, querying each distinct pair only once"""
+    points = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if cell_precision:
+        # One lookup per geohash cell: every point in the cell shares the address of its centre
+        points = np.column_stack(geohash_cell_center(points[:, 0], points[:, 1], cell_precision))
+    # Round up front so points within ~1 m collapse into one lookup before dispatch
+    unique_points, inverse = np.unique(points.round(COORD_PRECISION), axis=0, return_inverse=True)
+    unique_keys = [tuple(point) for point in unique_points.tolist()]
+    total = len(unique_keys)
+    if provider == 'offline':
+        unique_results = reverse_geocode_offline(unique_keys)
+        if progress and total:
+            progress(total, total)
+    else:
+        unique_results = []
+        last_update = 0.0
+        # Workers overlap network round-trips; overall throughput is still capped by the rate limiter
+        executor = ThreadPoolExecutor(max_workers=GEOCODE_MAX_WORKERS)
+        try:
+            lookups = executor.map(lambda key: reverse_geocode_osm(*key, refreshed=refreshed), unique_keys)
+            for done, result in enumerate(lookups, 1):
+                unique_results.append(result)
+                # Throttle UI updates: every Streamlit element update is a websocket round-trip
+                if progress and (done == total or time.monotonic() - last_update >= PROGRESS_INTERVAL):
+                    progress(done, total)
+                    last_update = time.monotonic()
+        finally:
+            # map() queues every key up front; when Stop or a rerun interrupts the loop (raised from
+            # the progress callback), drop the queued lookups instead of draining them at 1 req/s
+            executor.shutdown(wait=False, cancel_futures=True)
+    # Scatter the per-location results back to every input row in a single gather
+    return np.array(unique_results, dtype=object)[inverse.ravel()].tolist()
+
+def build_hover_text(df, cols, sep='<br>'):
+    """Join "col: value" pairs for every row using vectorized string concatenation"""
+    hover = None
+    for col in cols:
+        part = f"{col}: " + df[col].astype(str)
+        hover = part if hover is None else hover + sep + part
+    return hover
+
+def dataframe_cache_key(df):
+    """Exact content hash of a DataFrame (columns, index and every row) for keying cached exports"""
+    digest = hashlib.sha256(repr((list(df.columns), list(df.dtypes.astype(str)))).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# Download payloads are cached: Streamlit reruns the script on every interaction, and without the
+# cache each rerun would re-serialize the full dataset even if no download is ever clicked.
+# st.cache_data hashes only a sample of rows of large DataFrames, so the frame is passed unhashed
+# (leading underscore) and the cache is keyed on dataframe_cache_key instead.
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_MAX_ENTRIES, ttl=DATA_CACHE_TTL)
+def dataframe_to_csv(_df, df_key):
+    """Serialize a DataFrame to CSV bytes"""
+    # Written straight into a binary buffer in row chunks, without a full intermediate str copy
+    buffer = BytesIO()
+    _df.to_csv(buffer, index=False, encoding='utf-8', chunksize=CSV_WRITE_CHUNKSIZE)
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=DATA_CACHE_MAX_ENTRIES, ttl=DATA_CACHE_TTL)
+def dataframe_to_excel(_df, sheet_name, df_key):
+    """Serialize a DataFrame to xlsx bytes, streaming rows when xlsxwriter is available"""
+    buffer = BytesIO()
+    if EXCEL_WRITE_ENGINE == 'xlsxwriter':
+        # xlsxwriter silently skips cells past the sheet limits, so refuse up front like to_excel does
+        if len(_df) + 1 > EXCEL_MAX_ROWS or _df.shape[1] > EXCEL_MAX_COLS:
+            raise ValueError(
+                f"This sheet is too large! Your sheet size is: {len(_df) + 1}, {_df.shape[1]} "
+                f"Max sheet size is: {EXCEL_MAX_ROWS}, {EXCEL_MAX_COLS}"
+            )
+        # constant_memory flushes each finished row instead of holding the whole sheet. pandas'
+        # to_excel fills cells column by column, which that mode cannot handle, so write rows here.
+        workbook = xlsxwriter.Workbook(buffer, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+            'remove_timezone': True,
+            'nan_inf_to_errors': True  # ±inf (e.g. "inf" parsed by the CSV reader) become #NUM! cells
+        })
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, [str(col) for col in _df.columns])
+        # Box values as Python objects one chunk at a time rather than copying the whole frame up front
+        for start in range(0, len(_df), EXCEL_WRITE_CHUNKSIZE):
+            chunk = _df.iloc[start:start + EXCEL_WRITE_CHUNKSIZE]
+            values = chunk.astype(object).where(chunk.notna(), None)
+            for row_idx, row in enumerate(values.itertuples(index=False, name=None), start + 1):
+                # -1 means the row fell outside the sheet (-2, an over-long string truncated, is still written)
+                if worksheet.write_row(row_idx, 0, row) == -1:
+                    raise ValueError(f"Row {row_idx} is outside the Excel sheet limits")
+        workbook.close()
+    else:
+        _df.to_excel(buffer, index=False, sheet_name=sheet_name, engine=EXCEL_WRITE_ENGINE)
+    return buffer.getvalue()
+
+# A fragment reruns on its own when its widgets change, so toggling the map does not re-execute
+# the upload, validation and geocoding steps above it.
+@st.fragment
+def render_map_view(df_valid, lat_col, lon_col):
+    show_map = st.checkbox("Show Map View", value=True)
+    if show_map:
+        st.subheader("📍 Map View")
+
+        if len(df_valid) > MAP_AGGREGATE_THRESHOLD:
+            # Sending every row (plus its hover text) to the browser stalls rendering on big files,
+            # so large datasets are drawn as hexagon density cells aggregated from positions only
+            st.markdown(f"Showing {len(df_valid):,} points as density hexagons. Hover over a cell to see its point count.")
+            layer = pdk.Layer(
+                'HexagonLayer',
+                data=df_valid[[lon_col, lat_col]],
+                get_position=[lon_col, lat_col],
+                radius=MAP_HEXAGON_RADIUS,
+                pickable=True
+            )
+            tooltip = {"html": "{colorValue} points", "style": {"color": "white"}}
+        else:
+            st.markdown("Hover over points to see full row data.")
+            # The layer only reads positions and the prebuilt tooltip, so ship just those columns
+            # instead of serializing every column of every row into the page
+            map_df = df_valid[[lon_col, lat_col]].assign(hover=build_hover_text(df_valid, df_valid.columns))
+            layer = pdk.Layer(
+                'IconLayer',
+                data=map_df,
+                get_icon={
+                    "url": "https://img.icons8.com/emoji/48/tanker-truck.png",
+                    "width": 128,
+                    "height": 128,
+                    "anchor": [64, 128]
+                },
+                get_size=4,
+                size_scale=15,
+                get_position=[lon_col, lat_col],
+                pickable=True
+            )
+            tooltip = {"html": "{hover}", "style": {"color": "white"}}
+
+        st.pydeck_chart(pdk.Deck(
+            map_style='mapbox://styles/mapbox/streets-v12',
+            initial_view_state=pdk.ViewState(
+                latitude=df_valid[lat_col].mean(),
+                longitude=df_valid[lon_col].mean(),
+                zoom=10,
+                pitch=0
+            ),
+            layers=[layer],
+            tooltip=tooltip
+        ))
 
 def generate_unique_filename(prefix="geocoded"):
     return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
@@ -68,10 +464,33 @@ st.set_page_config(
 
 st.title("🗺️ Geocoding & Map Dashboard")
 
+st.sidebar.header("⚙️ Geocoding Settings")
+provider_label = st.sidebar.selectbox("Geocoding source", list(GEOCODING_PROVIDERS))
+provider = GEOCODING_PROVIDERS[provider_label]
+if provider == 'offline' and reverse_geocoder is None:
+    st.sidebar.error("Offline geocoding needs the 'reverse_geocoder' package.")
+    st.stop()
+use_cache = st.sidebar.checkbox(
+    "Use cache",
+    value=True,
+    help="Reuse previously geocoded locations. Turn off to re-fetch each location once from the API and update the cache."
+)
+# With the cache off, each location is refreshed once per session; later reruns (e.g. download
+# clicks) reuse the refreshed entries instead of querying Nominatim again
+if use_cache:
+    st.session_state.pop('refreshed_keys', None)
+refreshed_keys = None if use_cache else st.session_state.setdefault('refreshed_keys', set())
+cell_precision = st.sidebar.select_slider(
+    "Group nearby points (geohash precision)",
+    options=['Off', 5, 6, 7, 8, 9],
+    value='Off',
+    help="Geocode one point per geohash cell (8 ≈ 38 m × 19 m, 7 ≈ 150 m). Fewer API calls, slightly coarser addresses."
+)
+
 # File upload
 uploaded_file = st.file_uploader("Upload Excel or CSV file", type=["xlsx", "csv"])
 if uploaded_file:
-    df = load_file(uploaded_file)
+    df = load_file(uploaded_file.getvalue(), uploaded_file.name)
     st.subheader("📊 File Preview")
     st.dataframe(df.head(5))
 
@@ -84,80 +503,55 @@ if uploaded_file:
         st.info(f"Detected Latitude: {lat_col}, Longitude: {lon_col}")
 
     # Filter valid coordinates
-    df_valid = df[df.apply(lambda x: validate_coordinate_values(x[lat_col], x[lon_col]), axis=1)]
+    lat, lon, valid = parse_coordinates(df, lat_col, lon_col)
+    # Keep the parsed float columns so later steps never re-parse strings row by row
+    df_valid = df[valid].assign(**{lat_col: lat[valid], lon_col: lon[valid]})
     if df_valid.empty:
         st.error("No valid coordinate pairs found.")
         st.stop()
+    if len(df_valid) < len(df):
+        unparseable = int((lat.isna() | lon.isna()).sum())
+        out_of_range = len(df) - len(df_valid) - unparseable
+        st.warning(f"Skipped {len(df) - len(df_valid)} rows: {unparseable} with missing or non-numeric coordinates, {out_of_range} out of range.")
 
     # ==============================
     # Reverse Geocoding Option
     # ==============================
     run_geocode = st.checkbox("Run Reverse Geocoding (to get state and city)", value=False)
     if run_geocode:
-        st.info("Running reverse geocoding on valid coordinates...")
-        states = []
-        cities = []
-        full_addresses = []
-        for i, row in df_valid.iterrows():
-            result = reverse_geocode_osm(row[lat_col], row[lon_col])
-            states.append(result['state'])
-            cities.append(result['city'])
-            full_addresses.append(result['full_address'])
-        df_valid['State'] = states
-        df_valid['City'] = cities
-        df_valid['Full Address'] = full_addresses
-        st.success("✅ Reverse geocoding complete!")
+        st.caption(f"Coordinates are rounded to {COORD_PRECISION} decimal places (about 1 m) before lookup, so repeated points share one request.")
+        # Finished lookups land in the caches as they complete, so if a run is stopped or the page
+        # reruns midway, the next run only fetches what is still missing.
+        with st.status("Running reverse geocoding on valid coordinates...", expanded=True) as geocode_status:
+            progress_bar = st.progress(0.0)
+            results = reverse_geocode_batch(
+                df_valid[[lat_col, lon_col]].to_numpy(),
+                cell_precision=None if cell_precision == 'Off' else cell_precision,
+                provider=provider,
+                refreshed=refreshed_keys,
+                progress=lambda done, total: progress_bar.progress(done / total, text=f"Geocoded {done}/{total} unique locations")
+            )
+            geocode_status.update(label="✅ Reverse geocoding complete!", state="complete", expanded=False)
+        geocoded = pd.DataFrame.from_records(results, columns=GEOCODE_COLUMNS, index=df_valid.index)
+        # Few distinct states/cities per file: category codes store each name once and make the
+        # grouping below O(#states)
+        geocoded[['State', 'City']] = geocoded[['State', 'City']].astype('category')
+        df_valid = df_valid.assign(**geocoded)
 
         # Summary table by state
         if 'State' in df_valid.columns:
             st.subheader("📋 ID Column Distribution by State")
-            summary = df_valid.groupby('State')[df_valid.columns[0]].count().reset_index()
+            summary = df_valid.groupby('State', observed=True)[df_valid.columns[0]].count().reset_index()
             summary.rename(columns={df_valid.columns[0]: 'Count'}, inplace=True)
             st.dataframe(summary)
             # Export summary
-            summary_buffer = BytesIO()
-            summary.to_excel(summary_buffer, index=False, sheet_name="Summary")
-            summary_buffer.seek(0)
+            summary_buffer = dataframe_to_excel(summary, "Summary", dataframe_cache_key(summary))
             st.download_button("📥 Download Summary as Excel", summary_buffer, file_name=f"{generate_unique_filename('summary')}.xlsx")
 
     # ==============================
     # Map View
     # ==============================
-    show_map = st.checkbox("Show Map View", value=True)
-    if show_map:
-        st.subheader("📍 Map View")
-        st.markdown("Hover over points to see full row data.")
-
-        map_df = df_valid.copy()
-        hover_cols = df_valid.columns.tolist()
-        map_df['hover'] = map_df.apply(lambda x: '<br>'.join([f"{col}: {x[col]}" for col in hover_cols]), axis=1)
-
-        st.pydeck_chart(pdk.Deck(
-            map_style='mapbox://styles/mapbox/streets-v12',
-            initial_view_state=pdk.ViewState(
-                latitude=map_df[lat_col].mean(),
-                longitude=map_df[lon_col].mean(),
-                zoom=10,
-                pitch=0
-            ),
-            layers=[
-                pdk.Layer(
-                    'IconLayer',
-                    data=map_df,
-                    get_icon={
-                        "url": "https://img.icons8.com/emoji/48/tanker-truck.png",
-                        "width": 128,
-                        "height": 128,
-                        "anchor": [64, 128]
-                    },
-                    get_size=4,
-                    size_scale=15,
-                    get_position=[lon_col, lat_col],
-                    pickable=True
-                )
-            ],
-            tooltip={"html": "{hover}", "style": {"color": "white"}}
-        ))
+    render_map_view(df_valid, lat_col, lon_col)
 
     # ==============================
     # Export geocoded/processed data
@@ -170,20 +564,19 @@ if uploaded_file:
     # after df_valid or df_full is ready
     if run_geocode:
         st.subheader("📤 Export Data")
+        export_name = generate_unique_filename()
+        df_valid_key = dataframe_cache_key(df_valid)
 
-        excel_buffer = BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            df_valid.to_excel(writer, index=False, sheet_name="Geocoded Data")
-        excel_buffer.seek(0)
+        excel_buffer = dataframe_to_excel(df_valid, "Geocoded Data", df_valid_key)
         
         st.download_button(
             "📥 Download Geocoded Data as Excel",
             excel_buffer,
-            file_name=f"{generate_unique_filename()}.xlsx"
+            file_name=f"{export_name}.xlsx"
         )
 
         st.download_button(
             "📥 Download Geocoded Data as CSV",
-            df_valid.to_csv(index=False),
-            file_name=f"{generate_unique_filename()}.csv"
+            dataframe_to_csv(df_valid, df_valid_key),
+            file_name=f"{export_name}.csv"
         )